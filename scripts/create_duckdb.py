@@ -9,12 +9,24 @@ Author: jorgethomasm@ieee.org
 
 import duckdb
 import argparse
+import os
+import re
 from pathlib import Path
 import logging
 import time
 import yaml
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from utils.file_readers import read_parquet_to_table, read_csv_to_table, read_json_to_table, read_excel_to_table
+from utils.file_readers import (
+    read_parquet_to_table, read_parquet_to_month_partitions, read_csv_to_table, read_json_to_table, read_excel_to_table,
+    sniff_csv_options, _escape_path, _quote_identifier
+)
+
+# Prefer libyaml's C emitter when PyYAML was built with it
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
 
 # Setup logging
 logging.basicConfig(
@@ -23,13 +35,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# File type by (lowercase) file extension
+_FILE_TYPES = {
+    'parquet': 'parquet',
+    'csv': 'csv',
+    'json': 'json',
+    'xlsx': 'excel',
+    'xls': 'excel'
+}
+
+# Runs of characters that are not valid in a table name (non-ASCII letters are kept)
+_TABLE_NAME_RE = re.compile(r'\W+')
+
+# Sizes as DuckDB prints them, e.g. "12.4 GiB" or "953.6 MiB"
+_SIZE_RE = re.compile(r'^\s*([\d.]+)\s*([KMGT]i?B|bytes?)\s*$', re.IGNORECASE)
+_SIZE_UNITS = {
+    'byte': 1, 'bytes': 1,
+    'kb': 1000, 'mb': 1000 ** 2, 'gb': 1000 ** 3, 'tb': 1000 ** 4,
+    'kib': 1 << 10, 'mib': 1 << 20, 'gib': 1 << 30, 'tib': 1 << 40
+}
+
+# Trailing date of a time-sharded file name, e.g. "_2024_01_31" in "scada_2024_01_31" or "-202401" in
+# "scada-202401"; other trailing numbers (e.g. turbine ids as in "scada_wt01") are not shard suffixes
+_SHARD_SUFFIX_RE = re.compile(r'[_\-]+(?:19|20)\d{2}[_\-]?(?:0[1-9]|1[0-2])(?:[_\-]?(?:0[1-9]|[12]\d|3[01]))?$')
+
+
+def _parse_size(text: str):
+    """Return the number of bytes in a DuckDB size string like '12.4 GiB', or None if unparsable."""
+    match = _SIZE_RE.match(str(text))
+    if not match:
+        return None
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
 
 class DuckDBBuilder:
     """Build DuckDB database for exported SCADA tabular data files."""
     
-    def __init__(self, folder_name: str, base_path: Path = None):
+    def __init__(self, folder_name: str, base_path: Path = None, materialize_parquet: bool = False, threads: int = None,
+                 partition_scada: bool = False):
         self.folder_name = folder_name  # Folder name can be the Wind Farm name
 
+        # Materialize scada_data as one table per month behind a scada_data view
+        self.partition_scada = partition_scada
+
+        # DuckDB worker threads (default: all cores)
+        self.threads = threads or os.cpu_count()
+
+        # Parquet files are exposed as views unless asked to copy them into the database
+        self.materialize_parquet = materialize_parquet
+
         # If no base_path provided, use the parent directory of the scripts folder
         if base_path is None:
             # Get the directory where this script is located (scripts folder)
@@ -42,10 +96,33 @@ class DuckDBBuilder:
         self.raw_path = self.base_path / "data" / "raw" / folder_name
         self.processed_path = self.base_path / "data" / "processed"
         self.db_path = self.processed_path / f"{folder_name}_raw.duckdb"
+        self.csv_schema_path = self.processed_path / f"{folder_name}_csv_schema.yaml"
+        # Timestamp-sorted copies of unsorted parquet files, used by the parquet views
+        self.sorted_path = self.processed_path / f"{folder_name}_sorted"
+        # Spill directory for operations larger than memory (one per folder, so builds don't share it)
+        self.temp_path = self.processed_path / "duckdb_tmp" / folder_name
 
         # Track total raw file sizes
         self.total_raw_size = 0
 
+        # Source files of the parquet-backed views, by view name
+        self._parquet_views = {}
+
+        # Monthly tables behind each partitioned view, by view name
+        self._partitioned_views = {}
+
+        # Catalog snapshot taken after loading: table/view names, views, and columns per table
+        self._tables = []
+        self._views = set()
+        self._schema = {}
+
+        # Per-table ingestion options from config/ingestion.yaml
+        self.ingestion_config = {}
+
+        # Sniffed CSV dialect and column types, by file name
+        self._csv_schema = {}
+        self._csv_schema_changed = False
+
         # Ensure processed directory exists
         self.processed_path.mkdir(parents=True, exist_ok=True)
 
@@ -62,86 +139,285 @@ class DuckDBBuilder:
             logger.warning(f"Raw data path does not exist: {self.raw_path}")
             return discovered
 
-        # Discover parquet files
-        discovered['parquet'] = list(self.raw_path.glob("*.parquet"))
+        # Single pass over the folder, dispatching on the file extension
+        with os.scandir(self.raw_path) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if not entry.is_file():
+                    continue
+                file_type = _FILE_TYPES.get(entry.name.rpartition('.')[2].lower())
+                if file_type:
+                    discovered[file_type].append(Path(entry.path))
 
-        # Discover CSV files
-        discovered['csv'] = list(self.raw_path.glob("*.csv"))
+        # Load the ingestion options that apply to this folder
+        self.ingestion_config = self._load_ingestion_config()
 
-        # Discover JSON files
-        discovered['json'] = list(self.raw_path.glob("*.json"))
+        return discovered
 
-        # Discover Excel files (xlsx, xls)
-        discovered['excel'] = list(self.raw_path.glob("*.xlsx")) + list(self.raw_path.glob("*.xls"))
+    def _load_ingestion_config(self) -> dict:
+        """Return the per-table ingestion options for this folder from config/ingestion.yaml."""
+        config_file = self.base_path / "config" / "ingestion.yaml"
+        if not config_file.exists():
+            return {}
 
-        return discovered
+        try:
+            with open(config_file) as f:
+                config = yaml.safe_load(f) or {}
+        except Exception as e:
+            logger.warning(f"Could not read ingestion config {config_file}: {e}")
+            return {}
+
+        return config.get(self.folder_name) or {}
 
     def _generate_table_name(self, file_path: Path) -> str:
         """Generate a clean table name from file path."""
-        # Remove extension and sanitize
-        name = file_path.stem
-        # Replace spaces and special chars with underscores
-        name = name.replace(' ', '_').replace('-', '_')
-        # Remove any non-alphanumeric chars except underscore
-        name = ''.join(c for c in name if c.isalnum() or c == '_')
-        # Ensure lowercase
-        return name.lower()
+        # Replace runs of spaces and special chars with one underscore, trim and lowercase
+        return _TABLE_NAME_RE.sub('_', file_path.stem).strip('_').lower()
 
-    def _load_all_files(self, con, discovered):
-        """Load all discovered files into DuckDB tables."""
-        tables_created = []
+    def _load_file(self, con, reader, source, table_name: str, options: dict):
+        """Load a single file (or group of files) through its own cursor so loads can run concurrently."""
+        cursor = con.cursor()
+        try:
+            return reader(cursor, source, table_name, **options)
+        finally:
+            cursor.close()
 
-        # Load parquet files
-        for parquet_file in discovered['parquet']:
-            table_name = self._generate_table_name(parquet_file)
-            logger.info(f"Loading parquet: {parquet_file.name} → {table_name}")
-            try:
-                # Track file size
-                self.total_raw_size += parquet_file.stat().st_size
-                result = read_parquet_to_table(con, parquet_file, table_name)
-                logger.info(f"  ✓ Loaded {result['rows']:,} rows, {len(result['columns'])} columns")
-                tables_created.append(table_name)
-            except Exception as e:
-                logger.error(f"  ✗ Failed to load {parquet_file.name}: {e}")
+    def _load_csv_schema(self, csv_files: list):
+        """Load the cached CSV schemas written by a previous build, dropping files that are gone."""
+        self._csv_schema = {}
+        self._csv_schema_changed = False
+        if not self.csv_schema_path.exists():
+            return
 
-        # Load CSV files
-        for csv_file in discovered['csv']:
-            table_name = self._generate_table_name(csv_file)
-            logger.info(f"Loading CSV: {csv_file.name} → {table_name}")
-            try:
-                # Track file size
-                self.total_raw_size += csv_file.stat().st_size
-                result = read_csv_to_table(con, csv_file, table_name, auto_detect=True)
-                logger.info(f"  ✓ Loaded {result['rows']:,} rows, {len(result['columns'])} columns")
-                tables_created.append(table_name)
-            except Exception as e:
-                logger.error(f"  ✗ Failed to load {csv_file.name}: {e}")
+        try:
+            with open(self.csv_schema_path) as f:
+                self._csv_schema = yaml.safe_load(f) or {}
+        except Exception as e:
+            logger.warning(f"Could not read CSV schema cache {self.csv_schema_path}: {e}")
+
+        names = {f.name for f in csv_files}
+        for name in [n for n in self._csv_schema if n not in names]:
+            del self._csv_schema[name]
+            self._csv_schema_changed = True
+
+    def _save_csv_schema(self):
+        """Write the CSV schema cache if any file was (re-)sniffed."""
+        if not self._csv_schema_changed:
+            return
+
+        try:
+            with open(self.csv_schema_path, 'w') as f:
+                yaml.dump(self._csv_schema, f, Dumper=YamlDumper, default_flow_style=False, sort_keys=False, indent=2)
+            logger.info(f"  ✓ CSV schema cached to: {self.csv_schema_path}")
+        except Exception as e:
+            logger.error(f"  ✗ Failed to write CSV schema cache: {e}")
+
+    def _read_csv_cached(self, con, csv_path: Path, table_name: str, **options):
+        """Load a CSV file using its cached schema, sniffing it only when new or modified."""
+        stat = csv_path.stat()
+        entry = self._csv_schema.get(csv_path.name)
+        cached = bool(entry) and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime_ns
+        if not cached:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, **sniff_csv_options(con, csv_path)}
 
-        # Load JSON files
-        for json_file in discovered['json']:
-            table_name = self._generate_table_name(json_file)
-            logger.info(f"Loading JSON: {json_file.name} → {table_name}")
+        csv_options = {k: v for k, v in entry.items() if k not in ('size', 'mtime')}
+        try:
+            result = read_csv_to_table(con, csv_path, table_name, **csv_options, **options)
+        except Exception:
+            # Never keep a schema that failed to load, so the next build sniffs the file again
+            if self._csv_schema.pop(csv_path.name, None) is not None:
+                self._csv_schema_changed = True
+            raise
+
+        # Only cache a schema once it has loaded successfully
+        if not cached:
+            self._csv_schema[csv_path.name] = entry
+            self._csv_schema_changed = True
+        return result
+
+    def _parquet_is_sorted(self, con, parquet_file: Path) -> bool:
+        """
+        Check from the parquet metadata alone whether the file's row groups are ordered by timestamp,
+        i.e. each row group starts at or after the end of the previous one.
+        Row groups without usable statistics count as unsorted.
+        """
+        unsorted = con.execute("""
+            WITH row_groups AS (
+                SELECT
+                    row_group_id,
+                    TRY_CAST(stats_min_value AS TIMESTAMP) AS ts_min,
+                    TRY_CAST(stats_max_value AS TIMESTAMP) AS ts_max
+                FROM parquet_metadata(?)
+                WHERE path_in_schema = 'timestamp'
+            )
+            SELECT count(*)
+            FROM (SELECT *, lag(ts_max) OVER (ORDER BY row_group_id) AS prev_max FROM row_groups)
+            WHERE ts_min IS NULL OR ts_max IS NULL OR ts_min < prev_max
+        """, [str(parquet_file)]).fetchone()[0]
+        return unsorted == 0
+
+    def _ensure_sorted_parquet(self, con, parquet_file: Path) -> Path:
+        """
+        Return a parquet file with the data of parquet_file whose row groups are ordered by timestamp.
+        Sorted row groups have tight min/max statistics, so range filters on timestamp skip
+        whole row groups. Unsorted files are rewritten once into the sorted folder;
+        the copy is reused while the raw file keeps the size and mtime recorded next to it.
+        """
+        has_timestamp = con.execute(
+            "SELECT count(*) FROM parquet_schema(?) WHERE name = 'timestamp'", [str(parquet_file)]
+        ).fetchone()[0]
+        if not has_timestamp or self._parquet_is_sorted(con, parquet_file):
+            return parquet_file
+
+        sorted_file = self.sorted_path / f"{parquet_file.stem}_sorted.parquet"
+        # Size and mtime of the raw file the copy was made from (any change, even to an older mtime, invalidates it)
+        source_file = sorted_file.with_suffix(".source.yaml")
+        stat = parquet_file.stat()
+        source = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if sorted_file.exists() and source_file.exists():
             try:
-                # Track file size
-                self.total_raw_size += json_file.stat().st_size
-                result = read_json_to_table(con, json_file, table_name, auto_detect=True)
-                logger.info(f"  ✓ Loaded {result['rows']:,} rows, {len(result['columns'])} columns")
-                tables_created.append(table_name)
+                with open(source_file) as f:
+                    if yaml.safe_load(f) == source:
+                        return sorted_file
             except Exception as e:
-                logger.error(f"  ✗ Failed to load {json_file.name}: {e}")
-
-        # Load Excel files
-        for excel_file in discovered['excel']:
-            table_name = self._generate_table_name(excel_file)
-            logger.info(f"Loading Excel: {excel_file.name} → {table_name}")
+                logger.warning(f"  Could not read {source_file}: {e}")
+
+        logger.info(f"  Sorting {parquet_file.name} by timestamp → {sorted_file}")
+        self.sorted_path.mkdir(parents=True, exist_ok=True)
+        tmp_file = sorted_file.with_suffix(".tmp")
+        con.execute(f"""
+            COPY (SELECT * FROM read_parquet('{_escape_path(parquet_file)}') ORDER BY timestamp)
+            TO '{_escape_path(tmp_file)}' (FORMAT PARQUET, ROW_GROUP_SIZE 100000, COMPRESSION 'zstd')
+        """)
+        tmp_file.replace(sorted_file)
+        with open(source_file, 'w') as f:
+            yaml.dump(source, f, Dumper=YamlDumper, default_flow_style=False)
+        return sorted_file
+
+    def _read_parquet(self, con, parquet_files: list, table_name: str, **options):
+        """Load a group of parquet files as a table, or as a view over timestamp-sorted copies of them."""
+        if self.partition_scada and table_name == 'scada_data':
+            # Sorted sources let each month's range filter skip the other row groups
+            source_files = [self._ensure_sorted_parquet(con, f) for f in parquet_files]
             try:
+                result = read_parquet_to_month_partitions(con, source_files, table_name, **options)
+            except ValueError as e:
+                logger.warning(f"  Not partitioning {table_name}: {e}")
+            else:
+                self._partitioned_views[table_name] = result['partitions']
+                return result
+
+        if self.materialize_parquet:
+            return read_parquet_to_table(con, parquet_files, table_name, **options)
+
+        source_files = [self._ensure_sorted_parquet(con, f) for f in parquet_files]
+        result = read_parquet_to_table(con, source_files, table_name, materialize=False, **options)
+        self._parquet_views[table_name] = [f.resolve() for f in source_files]
+        return result
+
+    def _group_parquet_files(self, con, parquet_files: list) -> list:
+        """
+        Group time shards (e.g. scada_2024_01.parquet, scada_2024_02.parquet, ...) that share
+        a base name and an identical schema, so each group is loaded with one read_parquet([...]).
+        Only a trailing date counts as a shard suffix, so e.g. per-turbine files stay separate.
+        Returns (table_name, [files]) pairs; a file without matching shards forms its own group.
+        """
+        by_base = {}
+        for parquet_file in parquet_files:
+            base = self._generate_table_name(Path(_SHARD_SUFFIX_RE.sub('', parquet_file.stem)))
+            by_base.setdefault(base, []).append(parquet_file)
+
+        groups = []
+        for base, files in by_base.items():
+            # Only shards need their schema compared (the footer is read, not the data)
+            by_schema = {}
+            for parquet_file in files:
+                if len(files) == 1:
+                    schema = ()
+                else:
+                    try:
+                        schema = tuple(con.execute("DESCRIBE SELECT * FROM read_parquet(?)", [str(parquet_file)]).fetchall())
+                    except Exception:
+                        # Keep unreadable files on their own so their load error gets reported
+                        schema = (str(parquet_file),)
+                by_schema.setdefault(schema, []).append(parquet_file)
+
+            for group in by_schema.values():
+                name = self._generate_table_name(group[0])
+                if len(group) > 1:
+                    name = base or name
+                groups.append((name, group))
+
+        # Shards with different schemas, or a single file named like a shard group,
+        # would otherwise map to the same table
+        used_names = set()
+        for i, (name, group) in enumerate(groups):
+            candidate, suffix = name, 2
+            while candidate in used_names:
+                candidate = f"{name}_{suffix}"
+                suffix += 1
+            used_names.add(candidate)
+            groups[i] = (candidate, group)
+
+        return groups
+
+    def _load_all_files(self, con, discovered):
+        """Load all discovered files into DuckDB tables."""
+        tables_created = []
+
+        # Reader and log label per file type
+        readers = {
+            'parquet': ('parquet', self._read_parquet),
+            'csv': ('CSV', self._read_csv_cached),
+            'json': ('JSON', read_json_to_table),
+            'excel': ('Excel', read_excel_to_table)
+        }
+
+        # Build the list of (reader_fn, source, table_name, options, display_name) load tasks
+        tasks = []
+        for file_type, (label, reader) in readers.items():
+            if file_type == 'parquet':
+                # Parquet shards of the same schema load together as one table
+                sources = self._group_parquet_files(con, discovered['parquet'])
+            else:
+                sources = [(self._generate_table_name(f), f) for f in discovered[file_type]]
+
+            for table_name, source in sources:
+                files = source if isinstance(source, list) else [source]
+                display_name = files[0].name if len(files) == 1 else f"{len(files)} files ({files[0].name}, ...)"
+                logger.info(f"Loading {label}: {display_name} → {table_name}")
                 # Track file size
-                self.total_raw_size += excel_file.stat().st_size
-                result = read_excel_to_table(con, excel_file, table_name)
-                logger.info(f"  ✓ Loaded {result['rows']:,} rows, {len(result['columns'])} columns")
-                tables_created.append(table_name)
-            except Exception as e:
-                logger.error(f"  ✗ Failed to load {excel_file.name}: {e}")
+                self.total_raw_size += sum(f.stat().st_size for f in files)
+                # Row/column counts are only worth their queries when they get logged
+                options = {'log_stats': logger.isEnabledFor(logging.DEBUG)}
+                # Column allow-list for parquet files
+                columns = self.ingestion_config.get(table_name, {}).get('columns')
+                if file_type == 'parquet' and columns:
+                    options['columns'] = columns
+                tasks.append((reader, source, table_name, options, display_name))
+
+        if not tasks:
+            return tables_created
+
+        # Sniffed CSV schemas from previous builds
+        self._load_csv_schema(discovered['csv'])
+
+        # Each table is independent, so run the CREATE TABLE statements concurrently
+        with ThreadPoolExecutor(max_workers=min(8, len(tasks))) as executor:
+            futures = [
+                (executor.submit(self._load_file, con, reader, source, table_name, options), display_name, table_name)
+                for reader, source, table_name, options, display_name in tasks
+            ]
+            for future, display_name, table_name in futures:
+                try:
+                    result = future.result()
+                    logger.info(f"  ✓ Loaded {table_name}")
+                    if result['rows'] is not None:
+                        logger.debug(f"    {result['rows']:,} rows, {len(result['columns'])} columns")
+                    tables_created.append(table_name)
+                except Exception as e:
+                    logger.error(f"  ✗ Failed to load {display_name}: {e}")
+
+        self._save_csv_schema()
 
         logger.info(f"Successfully created {len(tables_created)} tables")
         return tables_created
@@ -169,26 +445,41 @@ class DuckDBBuilder:
         con = duckdb.connect(str(self.db_path))
 
         try:
+            # Threads, compression, checkpointing and spill settings for the loads below
+            self._configure_connection(con)
+
             # Load all discovered files into tables
             self._load_all_files(con, discovered)
 
-            # Add indexes
-            self._create_indexes(con)
+            # Read the catalog once and share it with the steps below
+            self._tables = [table[0] for table in con.execute("SHOW TABLES").fetchall()]
+            self._views = {view[0] for view in con.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal").fetchall()}
+            self._schema = self._fetch_schema(con)
+
+            # Sort tables by timestamp for zonemap pruning
+            self._cluster_tables(con, self._tables, self._schema, self._views)
 
             # Add table comments
-            self._add_documentation(con)
+            self._add_documentation(con, self._tables, self._views)
+
+            # Row and column counts from the catalog, shared by the reports below
+            table_stats = self._fetch_table_stats(con, self._tables, self._schema)
 
             # Validate
-            self._validate_database(con)
+            self._validate_database(con, table_stats)
 
             # Export schema to YAML
-            self._export_schema(con)
+            self._export_schema(con, self._schema, table_stats)
 
             # Calculate elapsed time
             elapsed_time = time.time() - start_time
 
+            # Write the WAL into the database file (checkpoint_threshold keeps most writes
+            # there until close), so the summary reports the file's full size
+            con.execute("CHECKPOINT")
+
             logger.info(f"✓ Database created successfully: {self.db_path}")
-            self._print_summary(con, elapsed_time)
+            self._print_summary(con, table_stats, elapsed_time)
 
         except Exception as e:
             logger.error(f"Error building database: {e}")
@@ -196,45 +487,93 @@ class DuckDBBuilder:
         finally:
             con.close()
     
-    def _create_indexes(self, con):
-        """Create indexes for performance on common columns across all tables."""
-        logger.info("Creating indexes...")
-
-        # Get all tables
-        tables = [table[0] for table in con.execute("SHOW TABLES").fetchall()]
-
-        # Common columns to index if they exist
-        index_candidates = ['timestamp', 'channel_id', 'id', 'date', 'datetime']
+    def _configure_connection(self, con):
+        """Apply connection-wide settings before loading data."""
+        con.execute(f"PRAGMA threads={self.threads}")
+        # Fewer WAL checkpoints interrupting the bulk loads
+        con.execute("PRAGMA checkpoint_threshold='4GB'")
+        # Cap memory so large loads spill to the temp directory instead of running out of memory
+        memory_limit_mb = self._memory_limit_mb(con)
+        if memory_limit_mb:
+            con.execute(f"PRAGMA memory_limit='{memory_limit_mb}MB'")
+        con.execute(f"PRAGMA temp_directory='{_escape_path(self.temp_path)}'")
+
+    def _memory_limit_mb(self, con):
+        """
+        Return 60% of physical memory in MB, scaled by this build's share of the cores
+        (so parallel builds of several folders split the memory between them).
+        The result never exceeds DuckDB's current limit, which also respects container
+        (cgroup) memory caps that the host's physical memory does not reflect.
+        Returns None where either value cannot be determined (DuckDB's default applies).
+        """
+        try:
+            total_memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (AttributeError, ValueError, OSError):
+            return None
+        current_limit = _parse_size(con.execute("SELECT current_setting('memory_limit')").fetchone()[0])
+        if current_limit is None:
+            return None
+        share = min(1.0, self.threads / (os.cpu_count() or 1))
+        return max(1, int(min(total_memory * 0.6 * share, current_limit)) // (1 << 20))
+
+    def _fetch_schema(self, con) -> dict:
+        """Return the columns (name, type, nullable) of all tables and views from one query."""
+        schema = {}
+        columns_info = con.execute("""
+            SELECT table_name, column_name, data_type, is_nullable
+            FROM duckdb_columns()
+            WHERE database_name = current_database() AND schema_name = 'main'
+            ORDER BY table_name, column_index
+        """).fetchall()
+        for table, name, data_type, nullable in columns_info:
+            schema.setdefault(table, []).append({
+                'name': name,
+                'type': data_type,
+                'nullable': nullable
+            })
+        return schema
+
+    def _cluster_tables(self, con, tables: list, schema: dict, views: set):
+        """
+        Rewrite tables with a timestamp column in timestamp order.
+        Sorted data gives tight min/max zonemaps per row group, so range filters
+        on timestamp skip row groups without the cost of a separate index.
+        Parquet views are skipped: their sort order is a property of the file.
+        """
+        logger.info("Clustering tables by timestamp...")
+
+        # Only the ORDER BY below needs to be honoured when rewriting
+        con.execute("PRAGMA preserve_insertion_order=false")
+
+        # Base tables that have a timestamp column (monthly partitions are already loaded from sorted files)
+        partitions = {t for partition_tables in self._partitioned_views.values() for t in partition_tables}
+        tables = [
+            table for table in tables
+            if table not in views and table not in partitions
+            and any(col['name'] == 'timestamp' for col in schema.get(table, []))
+        ]
 
-        indexes_created = 0
         for table in tables:
+            table_sql = _quote_identifier(table)
+            tmp_table_sql = _quote_identifier(f"{table}__clustered")
             try:
-                # Get columns for this table
-                columns = [col[0] for col in con.execute(f"DESCRIBE {table}").fetchall()]
-
-                # Create indexes for matching columns
-                for column in index_candidates:
-                    if column in columns:
-                        idx_name = f"idx_{table}_{column}"
-                        try:
-                            con.execute(f"CREATE INDEX {idx_name} ON {table}({column})")
-                            logger.info(f"  ✓ Created index {idx_name}")
-                            indexes_created += 1
-                        except Exception as e:
-                            logger.warning(f"  Could not create index {idx_name}: {e}")
+                con.execute("BEGIN TRANSACTION")
+                con.execute(f"CREATE TABLE {tmp_table_sql} AS SELECT * FROM {table_sql} ORDER BY timestamp")
+                con.execute(f"DROP TABLE {table_sql}")
+                con.execute(f"ALTER TABLE {tmp_table_sql} RENAME TO {table_sql}")
+                con.execute("COMMIT")
+                logger.info(f"  ✓ Clustered {table} by timestamp")
             except Exception as e:
-                logger.warning(f"  Could not process table {table}: {e}")
+                con.execute("ROLLBACK")
+                logger.warning(f"  Could not cluster table {table}: {e}")
 
-        if indexes_created == 0:
-            logger.info("  No indexes created (no matching columns found)")
+        if not tables:
+            logger.info("  No tables clustered (no timestamp columns found)")
     
-    def _add_documentation(self, con):
+    def _add_documentation(self, con, tables: list, views: set):
         """Add table comments based on common naming patterns."""
         logger.info("Adding documentation...")
 
-        # Get all tables
-        tables = [table[0] for table in con.execute("SHOW TABLES").fetchall()]
-
         # Common naming patterns and their descriptions
         comment_patterns = {
             #'scada': "Time series data from SCADA system",
@@ -245,6 +584,7 @@ class DuckDBBuilder:
             'channels': "Channel definitions and metadata"
         }
 
+        statements = []
         for table in tables:
             # Try to find a matching pattern
             comment = f"Data table: {table}"
@@ -253,23 +593,67 @@ class DuckDBBuilder:
                     comment = desc
                     break
 
+            object_type = "VIEW" if table in views else "TABLE"
+            statements.append(f"COMMENT ON {object_type} {_quote_identifier(table)} IS $${comment}$$")
+
+        if not statements:
+            return
+
+        # Apply all comments as one script in a single transaction
+        script = ";\n".join(["BEGIN TRANSACTION", *statements, "COMMIT"])
+        try:
+            con.execute(script)
+        except Exception as e:
+            # A script that fails to parse never starts its transaction
             try:
-                con.execute(f"COMMENT ON TABLE {table} IS '{comment}'")
-            except Exception as e:
-                logger.warning(f"  Could not add comment to {table}: {e}")
+                con.execute("ROLLBACK")
+            except Exception:
+                pass
+            logger.warning(f"  Could not add table comments: {e}")
     
-    def _validate_database(self, con):
+    def _fetch_table_stats(self, con, tables: list, schema: dict) -> dict:
+        """Return (rows, columns) for every table and view without scanning table data."""
+        # Base tables: the catalog tracks row and column counts of each table
+        stats = {
+            table: (rows, cols)
+            for table, rows, cols in con.execute("""
+                SELECT table_name, estimated_size, column_count
+                FROM duckdb_tables()
+                WHERE database_name = current_database() AND schema_name = 'main'
+            """).fetchall()
+        }
+
+        # Parquet views: row counts are stored in the file footers
+        if self._parquet_views:
+            files = [str(path) for paths in self._parquet_views.values() for path in paths]
+            file_rows = dict(con.execute(
+                "SELECT file_name, num_rows FROM parquet_file_metadata(?)", [files]
+            ).fetchall())
+            for view, paths in self._parquet_views.items():
+                stats[view] = (sum(file_rows.get(str(path), 0) for path in paths), len(schema.get(view, [])))
+
+        # Partitioned views: sum of their monthly tables
+        for view, partitions in self._partitioned_views.items():
+            stats[view] = (sum(stats[t][0] for t in partitions if t in stats), len(schema.get(view, [])))
+
+        # Any other view has to be counted
+        for table in tables:
+            if table not in stats:
+                rows = con.execute(f"SELECT COUNT(*) FROM {_quote_identifier(table)}").fetchone()[0]
+                stats[table] = (rows, len(schema.get(table, [])))
+
+        return {table: stats[table] for table in tables}
+
+    def _validate_database(self, con, table_stats: dict):
         """Basic validation checks."""
         logger.info("Validating database...")
 
         # Check row counts
-        tables = con.execute("SHOW TABLES").fetchall()
-        for (table,) in tables:
-            count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table, (count, _) in table_stats.items():
             if count == 0:
                 logger.warning(f"  Table {table} is empty!")
 
-    def _export_schema(self, con):
+    def _export_schema(self, con, schema: dict, table_stats: dict):
         """Export database schema to YAML file."""
         logger.info("Exporting schema to YAML...")
 
@@ -280,74 +664,49 @@ class DuckDBBuilder:
             'tables': {}
         }
 
-        # Get all tables
-        tables = [table[0] for table in con.execute("SHOW TABLES").fetchall()]
-
-        for table in tables:
-            try:
-                # Get row count
-                row_count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-
-                # Get column information
-                columns_info = con.execute(f"DESCRIBE {table}").fetchall()
-                columns = []
-                for col in columns_info:
-                    col_dict = {
-                        'name': col[0],
-                        'type': col[1],
-                        'nullable': col[2] == 'YES'
-                    }
-                    columns.append(col_dict)
-
-                # Get indexes for this table
-                try:
-                    indexes_result = con.execute(f"""
-                        SELECT index_name
-                        FROM duckdb_indexes()
-                        WHERE table_name = '{table}'
-                    """).fetchall()
-                    indexes = [idx[0] for idx in indexes_result]
-                except Exception:
-                    indexes = []
-
-                # Get table comment if available
-                try:
-                    comment_result = con.execute(f"""
-                        SELECT comment
-                        FROM duckdb_tables()
-                        WHERE table_name = '{table}'
-                    """).fetchone()
-                    comment = comment_result[0] if comment_result and comment_result[0] else None
-                except Exception:
-                    comment = None
+        # Get indexes for all tables
+        indexes_by_table = {}
+        try:
+            for table, index_name in con.execute("SELECT table_name, index_name FROM duckdb_indexes()").fetchall():
+                indexes_by_table.setdefault(table, []).append(index_name)
+        except Exception:
+            pass
 
-                # Build table schema
-                table_schema = {
-                    'row_count': row_count,
-                    'columns': columns
-                }
+        # Get table (and view) comments if available
+        try:
+            comments = dict(con.execute("""
+                SELECT table_name, comment FROM duckdb_tables() WHERE comment IS NOT NULL
+                UNION ALL
+                SELECT view_name, comment FROM duckdb_views() WHERE comment IS NOT NULL
+            """).fetchall())
+        except Exception:
+            comments = {}
 
-                if indexes:
-                    table_schema['indexes'] = indexes
+        for table, columns in schema.items():
+            # Build table schema
+            table_schema = {
+                'row_count': table_stats.get(table, (None, None))[0],
+                'columns': columns
+            }
 
-                if comment:
-                    table_schema['description'] = comment
+            if indexes_by_table.get(table):
+                table_schema['indexes'] = indexes_by_table[table]
 
-                schema_data['tables'][table] = table_schema
+            if comments.get(table):
+                table_schema['description'] = comments[table]
 
-            except Exception as e:
-                logger.warning(f"  Could not export schema for table {table}: {e}")
+            schema_data['tables'][table] = table_schema
 
         # Write to YAML file
         schema_file = self.processed_path / f"{self.folder_name}_raw_schema.yaml"
         try:
             with open(schema_file, 'w') as f:
-                yaml.dump(schema_data, f, default_flow_style=False, sort_keys=False, indent=2)
+                yaml.dump(schema_data, f, Dumper=YamlDumper, default_flow_style=False, sort_keys=False, indent=2)
             logger.info(f"  ✓ Schema exported to: {schema_file}")
         except Exception as e:
             logger.error(f"  ✗ Failed to write schema file: {e}")
 
-    def _print_summary(self, con, elapsed_time=None):
+    def _print_summary(self, con, table_stats: dict, elapsed_time=None):
         """Print database summary and save to log file."""
         # Build summary content
         summary_lines = []
@@ -356,11 +715,7 @@ class DuckDBBuilder:
         summary_lines.append("=" * 60)
         summary_lines.append("")
 
-        tables = con.execute("SHOW TABLES").fetchall()
-
-        for (table,) in tables:
-            count = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-            cols = len(con.execute(f"DESCRIBE {table}").fetchall())
+        for table, (count, cols) in table_stats.items():
             summary_lines.append(f"  {table:30} {count:>12,} rows  {cols:>3} columns")
 
         # Raw files total size
@@ -393,27 +748,89 @@ class DuckDBBuilder:
             logger.error(f"Failed to save summary log: {e}")
 
 
+def _load_wind_farms(base_path: Path) -> list:
+    """Return the wind farm folders listed in config/config.yaml."""
+    with open(base_path / "config" / "config.yaml") as f:
+        config = yaml.safe_load(f) or {}
+    return config.get('wind_farms') or []
+
+
+def _build_one(folder_name: str, base_path: Path, materialize_parquet: bool, partition_scada: bool, threads: int):
+    """Build the database of one folder (run in a worker process)."""
+    DuckDBBuilder(
+        folder_name, base_path, materialize_parquet=materialize_parquet, threads=threads, partition_scada=partition_scada
+    ).build()
+
+
+def _build_all(base_path: Path, materialize_parquet: bool, partition_scada: bool):
+    """Build the databases of all configured wind farms in parallel, one process per farm."""
+    project_path = base_path or Path(__file__).parent.parent
+    farms = _load_wind_farms(project_path)
+    if not farms:
+        logger.warning("No wind farms listed in config/config.yaml")
+        return
+
+    # Each farm has its own database file, so builds are independent; split the cores between them
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(len(farms), cpu_count // 4))
+    threads = max(1, cpu_count // workers)
+    logger.info(f"Building {len(farms)} wind farms with {workers} worker process(es)")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_build_one, farm, base_path, materialize_parquet, partition_scada, threads): farm
+            for farm in farms
+        }
+        for future in as_completed(futures):
+            farm = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"✗ Failed to build {farm}: {e}")
+                failed.append(farm)
+
+    if failed:
+        raise RuntimeError(f"Failed to build: {', '.join(failed)}")
+
+
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(description="Create a DuckDB database file from SCADA data")
     parser.add_argument(
         "--folder",
         required=True,
-        help="Folder name with (raw) data files (e.g., Kelmarsh)"
+        help="Folder name with (raw) data files (e.g., Kelmarsh), or 'all' for every wind farm in config/config.yaml"
     )
     parser.add_argument(
         "--base-path",
         default=None,
         help="Base project path (default: auto-detect from script location)"
     )
+    parser.add_argument(
+        "--materialize-parquet",
+        action="store_true",
+        help="Copy parquet files into database tables instead of creating views over them"
+    )
+    parser.add_argument(
+        "--partition-scada",
+        action="store_true",
+        help="Materialize scada_data as one table per month, queried through a scada_data view"
+    )
 
     args = parser.parse_args()
 
+    base_path = Path(args.base_path) if args.base_path else None
+
+    # Process all configured wind farms
+    if args.folder == "all":
+        _build_all(base_path, args.materialize_parquet, args.partition_scada)
+        return
+
     # Process single folder (wind farm)
-    if args.base_path:
-        builder = DuckDBBuilder(args.folder, Path(args.base_path))
-    else:
-        builder = DuckDBBuilder(args.folder)
+    builder = DuckDBBuilder(
+        args.folder, base_path, materialize_parquet=args.materialize_parquet, partition_scada=args.partition_scada
+    )
     builder.build()
 
 if __name__ == "__main__":
@@ -4,46 +4,204 @@ File readers utility for DuckDB.
 Author: jorgethomasm@ieee.org
 """
 
+from datetime import date
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, List, Optional, Tuple, Union
 import duckdb
 
+# Optional: polars with the calamine engine (fastexcel) parses Excel files much
+# faster than DuckDB's excel extension, and hands the result over as Arrow
+try:
+    import polars as pl
+    import fastexcel  # noqa: F401 - required by pl.read_excel(engine='calamine')
+    import pyarrow  # noqa: F401 - required by DataFrame.to_arrow() and con.register()
+except ImportError:
+    pl = None
+
 
 def _escape_path(path: Union[str, Path]) -> str:
-    """Return a SQL-safe single-quoted path."""
+    """
+    Return a SQL-safe single-quoted path.
+    Only needed where DuckDB does not accept bound parameters (view definitions,
+    which are stored as SQL text, COPY targets and PRAGMAs); queries bind the path with '?'.
+    """
     p = str(path)
     return p.replace("'", "''")
 
 
-def read_parquet_to_table(con: duckdb.DuckDBPyConnection, parquet_path: Union[str, Path], table_name: str) -> Dict:
+def _quote_identifier(name: str) -> str:
+    """Return a SQL-safe double-quoted identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_stats(con: duckdb.DuckDBPyConnection, table_name: str) -> Tuple[Optional[int], List[str]]:
+    """
+    Return (rows, columns) of a table from a single catalog query.
+    Row counts come from the table's storage info, so no scan is needed;
+    rows is None for views, which have no storage of their own.
+    """
+    result = con.execute("""
+        SELECT c.column_name, t.estimated_size
+        FROM duckdb_columns() c
+        LEFT JOIN duckdb_tables() t USING (database_name, schema_name, table_name)
+        WHERE c.database_name = current_database() AND c.schema_name = 'main' AND c.table_name = ?
+        ORDER BY c.column_index
+    """, [table_name]).fetchall()
+    rows = result[0][1] if result else None
+    return rows, [r[0] for r in result]
+
+
+def read_parquet_to_table(con: duckdb.DuckDBPyConnection, parquet_path: Union[str, Path, List[Union[str, Path]]], table_name: str, materialize: bool = True, columns: Optional[List[str]] = None, log_stats: bool = True) -> Dict:
     """
     Create a table from a parquet file:
       CREATE TABLE {table_name} AS SELECT * FROM read_parquet('{parquet_path}')
-    Returns dict with table, rows, columns.
+    parquet_path may also be a list of files with the same schema (e.g. daily shards),
+    which DuckDB then reads as one table in a single parallel scan.
+    If materialize is False, a view over the parquet file is created instead,
+    so the data is queried in place rather than copied into the database.
+    columns optionally restricts the load to the given columns; the parquet
+    reader then skips reading and decoding all other columns.
+    Returns dict with table, rows, columns (rows/columns are None if log_stats is False).
     """
-    p = Path(parquet_path)
+    paths = [Path(f) for f in parquet_path] if isinstance(parquet_path, (list, tuple)) else [Path(parquet_path)]
+    for p in paths:
+        if not p.exists():
+            raise FileNotFoundError(p)
+    table_sql = _quote_identifier(table_name)
+    select_sql = ", ".join(_quote_identifier(c) for c in columns) if columns else "*"
+    if materialize:
+        con.execute(f"CREATE TABLE {table_sql} AS SELECT {select_sql} FROM read_parquet(?)", [[str(p) for p in paths]])
+    else:
+        # Views store their SQL, so pin the absolute paths of the files
+        paths = [p.resolve() for p in paths]
+        files_sql = ", ".join(f"'{_escape_path(p)}'" for p in paths)
+        source_sql = files_sql if len(paths) == 1 else f"[{files_sql}]"
+        con.execute(f"CREATE VIEW {table_sql} AS SELECT {select_sql} FROM read_parquet({source_sql})")
+    if not log_stats:
+        return {"table": table_name, "rows": None, "columns": None}
+    rows, cols = _table_stats(con, table_name)
+    if rows is None:
+        # Views have no storage info; the parquet footers hold the row counts
+        rows = con.execute("SELECT SUM(num_rows) FROM parquet_file_metadata(?)", [[str(p) for p in paths]]).fetchone()[0]
+    return {"table": table_name, "rows": rows, "columns": cols}
+
+
+def read_parquet_to_month_partitions(con: duckdb.DuckDBPyConnection, parquet_path: Union[str, Path, List[Union[str, Path]]], table_name: str, timestamp_column: str = "timestamp", columns: Optional[List[str]] = None, log_stats: bool = True) -> Dict:
+    """
+    Create one table per calendar month of timestamp_column from parquet file(s):
+      CREATE TABLE {table_name}_YYYY_MM AS SELECT * FROM read_parquet(...) WHERE ts >= ... AND ts < ...
+    plus a view {table_name} over the UNION ALL of the monthly tables. Time-range filters on the
+    view skip the months outside the range via each table's min/max statistics.
+    Only months with data get a table; rows without a timestamp go to {table_name}_null.
+    All tables and the view are created in one transaction, so a failed load leaves none behind.
+    Raises ValueError if timestamp_column is missing, not a DATE/TIMESTAMP column, or has no values.
+    Returns dict with table, rows, columns (rows/columns are None if log_stats is False) and partitions.
+    """
+    paths = [Path(f) for f in parquet_path] if isinstance(parquet_path, (list, tuple)) else [Path(parquet_path)]
+    for p in paths:
+        if not p.exists():
+            raise FileNotFoundError(p)
+    files = [str(p) for p in paths]
+    ts_sql = _quote_identifier(timestamp_column)
+    select_sql = ", ".join(_quote_identifier(c) for c in columns) if columns else "*"
+
+    # DESCRIBE only reads the parquet footers
+    column_types = {r[0]: r[1] for r in con.execute("DESCRIBE SELECT * FROM read_parquet(?)", [files]).fetchall()}
+    ts_type = column_types.get(timestamp_column)
+    if ts_type is None or not ts_type.startswith(("TIMESTAMP", "DATE")):
+        raise ValueError(f"{table_name} has no DATE/TIMESTAMP column {timestamp_column} to partition by")
+
+    # Months that hold data, plus None if any rows have no timestamp
+    months = [r[0] for r in con.execute(
+        f"SELECT DISTINCT date_trunc('month', {ts_sql}) AS month FROM read_parquet(?) ORDER BY month NULLS LAST", [files]
+    ).fetchall()]
+    if not [m for m in months if m is not None]:
+        raise ValueError(f"No {timestamp_column} values to partition {table_name} by")
+
+    partitions = []
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for month in months:
+            if month is None:
+                partition = f"{table_name}_null"
+                where_sql, params = f"{ts_sql} IS NULL", [files]
+            else:
+                month = date(month.year, month.month, 1)
+                next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+                partition = f"{table_name}_{month.year:04d}_{month.month:02d}"
+                where_sql, params = f"{ts_sql} >= ? AND {ts_sql} < ?", [files, month, next_month]
+            con.execute(
+                f"CREATE TABLE {_quote_identifier(partition)} AS SELECT {select_sql} FROM read_parquet(?) WHERE {where_sql}",
+                params
+            )
+            partitions.append(partition)
+
+        union_sql = " UNION ALL ".join(f"SELECT * FROM {_quote_identifier(t)}" for t in partitions)
+        con.execute(f"CREATE VIEW {_quote_identifier(table_name)} AS {union_sql}")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    if not log_stats:
+        return {"table": table_name, "rows": None, "columns": None, "partitions": partitions}
+    _, cols = _table_stats(con, table_name)
+    rows = sum(_table_stats(con, t)[0] for t in partitions)
+    return {"table": table_name, "rows": rows, "columns": cols, "partitions": partitions}
+
+
+def sniff_csv_options(con: duckdb.DuckDBPyConnection, csv_path: Union[str, Path]) -> Dict:
+    """
+    Run DuckDB's CSV sniffer once and return the detected dialect and column types
+    as read_csv_to_table keyword arguments, e.g.
+      {'delim': ',', 'header': True, 'skip': 0, 'columns_types': {'id': 'BIGINT', ...}}
+    Passing these back to read_csv_to_table skips the sniffer on later loads.
+    """
+    p = Path(csv_path)
     if not p.exists():
         raise FileNotFoundError(p)
-    path_sql = _escape_path(p)
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_parquet('{path_sql}')")
-    rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-    cols = [c[0] for c in con.execute(f"DESCRIBE {table_name}").fetchall()]
-    return {"table": table_name, "rows": rows, "columns": cols}
+    delim, quote, escape, has_header, skip_rows, columns, date_format, timestamp_format = con.execute("""
+        SELECT Delimiter, Quote, Escape, HasHeader, SkipRows, Columns, DateFormat, TimestampFormat
+        FROM sniff_csv(?)
+    """, [str(p)]).fetchone()
+
+    options = {"delim": delim, "header": bool(has_header), "skip": int(skip_rows)}
+    # A file without quote/escape characters reports a placeholder instead
+    # (e.g. "(empty)" or a NUL character), which read_csv does not accept
+    if quote and len(quote) == 1 and quote != "\0":
+        options["quote"] = quote
+    if escape and len(escape) == 1 and escape != "\0":
+        options["escape"] = escape
+    if date_format:
+        options["dateformat"] = date_format
+    if timestamp_format:
+        options["timestampformat"] = timestamp_format
+    options["columns_types"] = {c["name"]: c["type"] for c in columns}
+    return options
 
 
-def read_csv_to_table(con: duckdb.DuckDBPyConnection, csv_path: Union[str, Path], table_name: str, auto_detect: bool = True, **read_csv_kwargs) -> Dict:
+def read_csv_to_table(con: duckdb.DuckDBPyConnection, csv_path: Union[str, Path], table_name: str, auto_detect: bool = True, columns_types: Optional[Dict[str, str]] = None, log_stats: bool = True, **read_csv_kwargs) -> Dict:
     """
     Create a table from a CSV file using read_csv.
+    If columns_types (column name -> DuckDB type) is given, the sniffer is skipped and the
+    columns are read with exactly these types; pass the dialect (delim, header, ...) along with it.
     Additional keyword args will be formatted as SQL literals where supported (e.g. sep=',', header=True).
+    If log_stats is False, the row/column count queries are skipped and returned as None.
     """
     p = Path(csv_path)
     if not p.exists():
         raise FileNotFoundError(p)
-    path_sql = _escape_path(p)
 
     # Build optional args string
     args = []
-    if auto_detect:
+    if columns_types:
+        args.append("auto_detect=false")
+        columns_sql = ", ".join(
+            "'{}': '{}'".format(name.replace("'", "''"), dtype.replace("'", "''"))
+            for name, dtype in columns_types.items()
+        )
+        args.append(f"columns={{{columns_sql}}}")
+    elif auto_detect:
         args.append("auto_detect=true")
     for k, v in read_csv_kwargs.items():
         if isinstance(v, bool):
@@ -55,37 +213,62 @@ def read_csv_to_table(con: duckdb.DuckDBPyConnection, csv_path: Union[str, Path]
             args.append(f"{k}='{val}'")
     args_sql = ", " + ", ".join(args) if args else ""
 
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_csv('{path_sql}'{args_sql})")
-    rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-    cols = [c[0] for c in con.execute(f"DESCRIBE {table_name}").fetchall()]
+    con.execute(f"CREATE TABLE {_quote_identifier(table_name)} AS SELECT * FROM read_csv(?{args_sql})", [str(p)])
+    if not log_stats:
+        return {"table": table_name, "rows": None, "columns": None}
+    rows, cols = _table_stats(con, table_name)
     return {"table": table_name, "rows": rows, "columns": cols}
 
 
-def read_json_to_table(con: duckdb.DuckDBPyConnection, json_path: Union[str, Path], table_name: str, auto_detect: bool = True) -> Dict:
+def read_json_to_table(con: duckdb.DuckDBPyConnection, json_path: Union[str, Path], table_name: str, auto_detect: bool = True, log_stats: bool = True) -> Dict:
     """
     Create a table from a JSON file using read_json.
+    If log_stats is False, the row/column count queries are skipped and returned as None.
     """
     p = Path(json_path)
     if not p.exists():
         raise FileNotFoundError(p)
-    path_sql = _escape_path(p)
     args_sql = "auto_detect=true" if auto_detect else ""
     args_fragment = f", {args_sql}" if args_sql else ""
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_json('{path_sql}'{args_fragment})")
-    rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-    cols = [c[0] for c in con.execute(f"DESCRIBE {table_name}").fetchall()]
+    con.execute(f"CREATE TABLE {_quote_identifier(table_name)} AS SELECT * FROM read_json(?{args_fragment})", [str(p)])
+    if not log_stats:
+        return {"table": table_name, "rows": None, "columns": None}
+    rows, cols = _table_stats(con, table_name)
     return {"table": table_name, "rows": rows, "columns": cols}
 
 
-def read_excel_to_table(con: duckdb.DuckDBPyConnection, xls_path: Union[str, Path], table_name: str, sheet: Union[str, int, None] = None) -> Dict:
+def read_excel_to_table(con: duckdb.DuckDBPyConnection, xls_path: Union[str, Path], table_name: str, sheet: Union[str, int, None] = None, log_stats: bool = True) -> Dict:
     """
-    Create a table from an Excel file. Attempts to INSTALL/LOAD the 'excel' extension if needed.
-    sheet may be a name or index (0-based). If None, DuckDB will read the first sheet.
+    Create a table from an Excel file.
+    If polars, fastexcel and pyarrow are installed, the file is parsed with the calamine engine and
+    ingested from Arrow; otherwise attempts to INSTALL/LOAD the 'excel' extension if needed.
+    sheet may be a name or index (0-based). If None, the first sheet is read.
+    If log_stats is False, the row/column count queries are skipped and returned as None.
     """
     p = Path(xls_path)
     if not p.exists():
         raise FileNotFoundError(p)
-    path_sql = _escape_path(p)
+
+    if pl is not None:
+        if sheet is None:
+            sheet_kwargs = {}
+        elif isinstance(sheet, int):
+            sheet_kwargs = {"sheet_id": sheet + 1}
+        else:
+            sheet_kwargs = {"sheet_name": sheet}
+        arrow_table = pl.read_excel(p, engine="calamine", **sheet_kwargs).to_arrow()
+
+        # Register the Arrow table and copy it into DuckDB
+        tmp_name = f"{table_name}_tmp"
+        con.register(tmp_name, arrow_table)
+        try:
+            con.execute(f"CREATE TABLE {_quote_identifier(table_name)} AS SELECT * FROM {_quote_identifier(tmp_name)}")
+        finally:
+            con.unregister(tmp_name)
+        if not log_stats:
+            return {"table": table_name, "rows": None, "columns": None}
+        rows, cols = _table_stats(con, table_name)
+        return {"table": table_name, "rows": rows, "columns": cols}
 
     # Ensure excel extension is available
     try:
@@ -98,14 +281,15 @@ def read_excel_to_table(con: duckdb.DuckDBPyConnection, xls_path: Union[str, Pat
         except Exception as e:
             raise RuntimeError("DuckDB Excel extension is not available and could not be installed/loaded") from e
 
+    params = [str(p)]
     if sheet is None:
         sheet_arg = ""
     else:
-        # Escape single quotes in sheet name/index and build the argument safely
-        s = str(sheet).replace("'", "''")
-        sheet_arg = f", sheet='{s}'"
+        sheet_arg = ", sheet=?"
+        params.append(str(sheet))
 
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_excel('{path_sql}'{sheet_arg})")
-    rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-    cols = [c[0] for c in con.execute(f"DESCRIBE {table_name}").fetchall()]
+    con.execute(f"CREATE TABLE {_quote_identifier(table_name)} AS SELECT * FROM read_excel(?{sheet_arg})", params)
+    if not log_stats:
+        return {"table": table_name, "rows": None, "columns": None}
+    rows, cols = _table_stats(con, table_name)
     return {"table": table_name, "rows": rows, "columns": cols}
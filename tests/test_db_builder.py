@@ -1,5 +1,32 @@
 from pathlib import Path
-from scripts.create_duckdb import DuckDBBuilder
+import duckdb
+import pytest
+from scripts.create_duckdb import DuckDBBuilder, _parse_size
+from scripts.utils.file_readers import read_parquet_to_month_partitions
+
+
+class FakeConnection:
+    """Answers the DESCRIBE queries of _group_parquet_files from a {file name: schema} dict."""
+
+    def __init__(self, schemas):
+        self.schemas = schemas
+
+    def execute(self, query, params):
+        self.result = self.schemas[Path(params[0]).name]
+        return self
+
+    def fetchall(self):
+        return self.result
+
+
+SCHEMA_A = [("timestamp", "TIMESTAMP"), ("power", "DOUBLE")]
+SCHEMA_B = [("timestamp", "TIMESTAMP"), ("wind_speed", "DOUBLE")]
+
+
+def write_parquet(con, path, query):
+    """Write the result of query to a parquet file."""
+    con.execute(f"COPY ({query}) TO '{path}' (FORMAT PARQUET)")
+    return path
 
 class TestDuckDBBuilder:
     
@@ -25,4 +52,131 @@ class TestDuckDBBuilder:
         """Table names should remove special characters."""
         builder = DuckDBBuilder("test_farm")
         result = builder._generate_table_name(Path("data@#$%.json"))
-        assert result == "data"
\ No newline at end of file
+        assert result == "data"
+    
+    def test_generate_table_name_collapses_separators(self):
+        """Runs of special characters should become a single underscore."""
+        builder = DuckDBBuilder("test_farm")
+        result = builder._generate_table_name(Path("SCADA - Channels (v2).csv"))
+        assert result == "scada_channels_v2"
+    
+    def test_discover_data_files_by_extension(self, tmp_path):
+        """Files should be grouped by extension in a single directory scan."""
+        raw_path = tmp_path / "data" / "raw" / "test_farm"
+        raw_path.mkdir(parents=True)
+        for name in ["scada.parquet", "channels.CSV", "modes.json", "specs.xlsx", "old.xls", "notes.txt"]:
+            (raw_path / name).touch()
+        (raw_path / "subfolder.csv").mkdir()
+        builder = DuckDBBuilder("test_farm", tmp_path)
+        discovered = builder._discover_data_files()
+        assert [p.name for p in discovered['parquet']] == ["scada.parquet"]
+        assert [p.name for p in discovered['csv']] == ["channels.CSV"]
+        assert [p.name for p in discovered['json']] == ["modes.json"]
+        assert [p.name for p in discovered['excel']] == ["old.xls", "specs.xlsx"]
+    
+    def test_generate_table_name_keeps_non_ascii_letters(self):
+        """Non-ASCII letters (e.g. in farm names) should be kept, like str.isalnum()."""
+        builder = DuckDBBuilder("test_farm")
+        result = builder._generate_table_name(Path("Björkö_Turbines.parquet"))
+        assert result == "björkö_turbines"
+    
+    def test_parse_size_reads_duckdb_memory_limits(self):
+        """DuckDB size strings should convert to bytes; unknown formats give None."""
+        assert _parse_size("1.0 GiB") == 1 << 30
+        assert _parse_size("512.0 MiB") == 512 << 20
+        assert _parse_size("2GB") == 2 * 1000 ** 3
+        assert _parse_size("unlimited") is None
+    
+    def test_group_parquet_files_merges_date_shards(self):
+        """Date-suffixed shards with one schema should load as one table named after their base."""
+        builder = DuckDBBuilder("test_farm")
+        files = [Path("scada_2024_01.parquet"), Path("scada_2024_02.parquet"), Path("scada-20240301.parquet")]
+        con = FakeConnection({f.name: SCHEMA_A for f in files})
+        assert builder._group_parquet_files(con, files) == [("scada", files)]
+    
+    def test_group_parquet_files_keeps_turbines_separate(self):
+        """Other trailing numbers (e.g. turbine ids) should not merge files."""
+        builder = DuckDBBuilder("test_farm")
+        files = [Path("scada_wt01.parquet"), Path("scada_wt02.parquet"), Path("Turbine_Data_Kelmarsh_1_228.parquet")]
+        groups = builder._group_parquet_files(None, files)
+        assert groups == [("scada_wt01", [files[0]]), ("scada_wt02", [files[1]]), ("turbine_data_kelmarsh_1_228", [files[2]])]
+    
+    def test_group_parquet_files_splits_by_schema(self):
+        """Shards with different schemas should load as separate tables with distinct names."""
+        builder = DuckDBBuilder("test_farm")
+        files = [Path(f"scada_2024_0{m}.parquet") for m in range(1, 5)]
+        con = FakeConnection({files[0].name: SCHEMA_A, files[1].name: SCHEMA_B, files[2].name: SCHEMA_A, files[3].name: SCHEMA_B})
+        groups = builder._group_parquet_files(con, files)
+        assert groups == [("scada", [files[0], files[2]]), ("scada_2", [files[1], files[3]])]
+    
+    def test_group_parquet_files_avoids_name_collisions(self):
+        """A single file named like a shard group should not reuse the group's table name."""
+        builder = DuckDBBuilder("test_farm")
+        files = [Path("scada_2024_01.parquet"), Path("scada_2024_02.parquet"), Path("Scada.parquet")]
+        con = FakeConnection({files[0].name: SCHEMA_A, files[1].name: SCHEMA_A, files[2].name: SCHEMA_B})
+        groups = builder._group_parquet_files(con, files)
+        assert groups == [("scada", files[:2]), ("scada_2", [files[2]])]
+    
+    def test_month_partitions_skip_empty_months_and_keep_nulls(self, tmp_path):
+        """Only months with data get a table, and rows without a timestamp are kept in a _null table."""
+        con = duckdb.connect()
+        parquet_file = write_parquet(con, tmp_path / "scada.parquet", """
+            SELECT * FROM (VALUES (TIMESTAMP '2024-01-05', 1.0), (TIMESTAMP '2024-01-31 23:50', 2.0),
+                                  (TIMESTAMP '2024-03-01', 3.0), (NULL, 4.0)) t(timestamp, power)
+        """)
+        result = read_parquet_to_month_partitions(con, parquet_file, "scada_data")
+        assert result['partitions'] == ["scada_data_2024_01", "scada_data_2024_03", "scada_data_null"]
+        assert result['rows'] == 4
+        assert con.execute("SELECT count(*) FROM scada_data").fetchone()[0] == 4
+    
+    def test_month_partitions_reject_non_timestamp_column(self, tmp_path):
+        """A missing or non-temporal timestamp column should raise ValueError before creating tables."""
+        con = duckdb.connect()
+        parquet_file = write_parquet(con, tmp_path / "scada.parquet", "SELECT '2024-01-05' AS timestamp, 1.0 AS power")
+        with pytest.raises(ValueError):
+            read_parquet_to_month_partitions(con, parquet_file, "scada_data")
+        with pytest.raises(ValueError):
+            read_parquet_to_month_partitions(con, parquet_file, "scada_data", timestamp_column="time")
+        assert con.execute("SELECT count(*) FROM duckdb_tables()").fetchone()[0] == 0
+    
+    def test_month_partitions_roll_back_on_failure(self, tmp_path):
+        """A failure part-way through should leave no partition tables behind."""
+        con = duckdb.connect()
+        parquet_file = write_parquet(con, tmp_path / "scada.parquet", """
+            SELECT * FROM (VALUES (TIMESTAMP '2024-01-05', 1.0), (TIMESTAMP '2024-02-05', 2.0)) t(timestamp, power)
+        """)
+        con.execute("CREATE TABLE scada_data_2024_02 (x INTEGER)")
+        with pytest.raises(duckdb.Error):
+            read_parquet_to_month_partitions(con, parquet_file, "scada_data")
+        tables = [r[0] for r in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()]
+        assert tables == ["scada_data_2024_02"]
+    
+    def test_read_csv_cached_loads_unquoted_csv_from_cache(self, tmp_path):
+        """A CSV without quote characters should load when sniffed and again from the cached schema."""
+        raw_path = tmp_path / "data" / "raw" / "test_farm"
+        raw_path.mkdir(parents=True)
+        csv_file = raw_path / "channels.csv"
+        csv_file.write_text("id,name,value\n1,power,2.5\n2,wind_speed,7.1\n")
+
+        builder = DuckDBBuilder("test_farm", tmp_path)
+        builder._load_csv_schema([csv_file])
+        con = duckdb.connect()
+        assert builder._read_csv_cached(con, csv_file, "channels")['rows'] == 2
+        builder._save_csv_schema()
+        assert builder.csv_schema_path.exists()
+
+        builder = DuckDBBuilder("test_farm", tmp_path)
+        builder._load_csv_schema([csv_file])
+        assert "channels.csv" in builder._csv_schema
+        con = duckdb.connect()
+        assert builder._read_csv_cached(con, csv_file, "channels")['rows'] == 2
+        assert con.execute("SELECT name FROM channels ORDER BY id").fetchall() == [("power",), ("wind_speed",)]
+        assert not builder._csv_schema_changed
+    
+    def test_load_csv_schema_drops_missing_files(self, tmp_path):
+        """Cached schemas of CSV files that no longer exist should be pruned."""
+        builder = DuckDBBuilder("test_farm", tmp_path)
+        builder.csv_schema_path.write_text("old.csv:\n  size: 1\n  mtime: 1\n")
+        builder._load_csv_schema([])
+        assert builder._csv_schema == {}
+        assert builder._csv_schema_changed